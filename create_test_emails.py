@@ -1,193 +1,265 @@
 #!/usr/bin/env python3
-“””
+"""
 create_test_emails.py - Creates test emails in Outlook from CSV using Microsoft Graph API
 Reads the test email CSV and creates draft messages in the specified folder
-“””
+"""
 
 import os
 import csv
-import requests
-import msal
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from datetime import datetime
 
-# ========= CONFIG (use same as graph_demo.py) =========
+from graph_auth import acquire_token
+from graph_helpers import GRAPH, SESSION, find_mail_folder_id
 
-CLIENT_ID = “0ade3d5c-b527-46ad-adac-af00003a111b”
-AUTHORITIES = [
-“https://login.microsoftonline.com/consumers”,
-“https://login.microsoftonline.com/common”,
-]
-SCOPES = [“User.Read”, “Mail.ReadWrite”]
-GRAPH = “https://graph.microsoft.com/v1.0”
-DEMO_FOLDER_NAME = “DEMO for PNC”
+try:
+    import orjson  # optional C JSON encoder
+except ImportError:
+    orjson = None
+
+# ========= CONFIG (sign-in settings are shared in graph_auth.py) =========
+
+DEMO_FOLDER_NAME = "DEMO for PNC"
 
 # Path to your CSV file
 
-CSV_FILE = “test_emails.csv”  # Change this to your CSV filename
+CSV_FILE = "test_emails.csv"  # Change this to your CSV filename
+
+# Graph JSON batching: at most 20 sub-requests per $batch call
+BATCH_SIZE = 20
+MAX_RETRIES = 5
+# Throttling only: a 504 may still have created the message, so resending could duplicate it
+RETRY_STATUSES = (429, 503)
+# $batch calls in flight at once. This does NOT keep us under Outlook's limit of
+# 4 concurrent requests per app per mailbox: Graph counts every sub-request, so
+# 4 batches of 20 can put up to 80 creates on the mailbox. The excess comes back
+# as per-item 429s, which send_batch retries after Retry-After.
+MAX_CONCURRENT_BATCHES = 4
+# Rows read ahead of the senders; keeps memory bounded for very large CSVs
+CSV_CHUNK_ROWS = 10000
 
 # ==========================
 
-def acquire_token_with_diagnostics():
-“”“Same auth function from graph_demo.py”””
-last_error_detail = None
-for authority in AUTHORITIES:
-print(f”Trying authority: {authority}”)
-app = msal.PublicClientApplication(client_id=CLIENT_ID, authority=authority)
-
-```
-    # Try cached token first
-    accounts = app.get_accounts()
-    if accounts:
-        try:
-            result = app.acquire_token_silent(SCOPES, account=accounts[0])
-            if result and "access_token" in result:
-                print("Got cached token.")
-                return result["access_token"]
-        except Exception as e:
-            print(f"Silent token attempt failed: {e}")
-
-    # Device code flow
+# SESSION (graph_helpers) retries idempotent requests only; $batch POSTs
+# handle throttling in send_batch.
+
+
+def _dumps(obj):
+    """Serialize a request body to UTF-8 JSON bytes (orjson when installed)"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+def build_message(email_data):
+    """Build the Graph message payload for one email"""
+    return {
+        "subject": email_data['subject'],
+        "body": {
+            "contentType": "Text",
+            "content": email_data['body']
+        },
+        "from": {
+            "emailAddress": {
+                "address": email_data['from_email'],
+                "name": email_data['from_name']
+            }
+        },
+        "receivedDateTime": email_data['date'],
+        "isDraft": False  # Make it look like a received message
+    }
+
+
+def _retry_after(resp_headers, attempt):
+    """Seconds to wait before a retry: Retry-After if given, else exponential backoff"""
+    value = (resp_headers or {}).get("Retry-After")
     try:
-        flow = app.initiate_device_flow(scopes=SCOPES)
-    except Exception as e:
-        last_error_detail = f"initiate_device_flow exception: {e}"
-        print(f"Device flow init error: {e}")
-        continue
-
-    if "user_code" not in flow:
-        err = flow.get("error") or "unknown_error"
-        desc = flow.get("error_description") or "No description"
-        last_error_detail = f"{err}: {desc}"
-        print(f"Device flow init response error — {err}: {desc}")
-        continue
-
-    print(flow["message"])
-    result = app.acquire_token_by_device_flow(flow)
-
-    if "access_token" in result:
-        print("Token acquired.")
-        return result["access_token"]
-
-    err = result.get("error")
-    desc = result.get("error_description")
-    last_error_detail = f"{err}: {desc}"
-    print(f"Device flow acquisition failed — {err}: {desc}")
-
-raise RuntimeError(f"Failed to acquire token. Details: {last_error_detail}")
-```
-
-def find_mail_folder_id(headers, display_name):
-“”“Find folder ID by name”””
-safe = display_name.replace(”’”, “’’”)
-r = requests.get(
-f”{GRAPH}/me/mailFolders”,
-headers=headers,
-params={”$filter”: f”displayName eq ‘{safe}’”, “$top”: 10}
-)
-if not r.ok:
-raise RuntimeError(f”Failed to find folder: {r.text}”)
-vals = r.json().get(“value”, [])
-return vals[0][“id”] if vals else None
-
-def create_email_in_folder(headers, folder_id, email_data):
-“”“Create a draft email in the specified folder”””
-# Build the message payload
-message = {
-“subject”: email_data[‘subject’],
-“body”: {
-“contentType”: “Text”,
-“content”: email_data[‘body’]
-},
-“from”: {
-“emailAddress”: {
-“address”: email_data[‘from_email’],
-“name”: email_data[‘from_name’]
-}
-},
-“receivedDateTime”: email_data[‘date’],
-“isDraft”: False  # Make it look like a received message
-}
-
-```
-# Create the message
-r = requests.post(
-    f"{GRAPH}/me/mailFolders/{folder_id}/messages",
-    headers=headers,
-    json=message
-)
-
-if r.ok:
-    return r.json()
-else:
-    print(f"Failed to create email: {email_data['subject']}")
-    print(f"Error: {r.status_code} - {r.text}")
-    return None
-```
-
-def parse_csv_and_create_emails(csv_path, headers, folder_id):
-“”“Read CSV and create all test emails”””
-created_count = 0
-failed_count = 0
-
-```
-with open(csv_path, 'r', encoding='utf-8') as f:
-    reader = csv.DictReader(f)
-    
-    for row in reader:
-        email_data = {
-            'date': row['Date'] + 'T09:00:00Z',  # Add time component
-            'from_email': row['From Email'],
-            'from_name': row['From Name'],
-            'subject': row['Subject'],
-            'body': row['Email Body Preview']
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return float(2 ** attempt)
+
+
+def send_batch(post_headers, folder_id, batch_rows):
+    """
+    Create up to BATCH_SIZE emails with a single Graph $batch request.
+    post_headers are the auth headers plus the JSON Content-Type/Accept (see main).
+    Throttled sub-requests (429/503) are resent after their Retry-After delay.
+    Returns (created_count, failed_count, log_lines); the caller prints the log
+    so output from concurrent batches does not interleave.
+    """
+    created_count = 0
+    failed_count = 0
+    log = []
+    pending = {str(i): row for i, row in enumerate(batch_rows)}
+
+    for attempt in range(MAX_RETRIES + 1):
+        payload = {
+            "requests": [
+                {
+                    "id": req_id,
+                    "method": "POST",
+                    "url": f"/me/mailFolders/{folder_id}/messages",
+                    "headers": {"Content-Type": "application/json"},
+                    "body": build_message(row),
+                }
+                for req_id, row in pending.items()
+            ]
         }
-        
-        print(f"Creating: {email_data['subject'][:50]}...")
-        result = create_email_in_folder(headers, folder_id, email_data)
-        
-        if result:
-            created_count += 1
-            print(f"  ✓ Created successfully")
-        else:
-            failed_count += 1
-            print(f"  ✗ Failed")
-
-return created_count, failed_count
-```
+        r = SESSION.post(f"{GRAPH}/$batch", headers=post_headers, data=_dumps(payload))
+
+        if r.status_code in RETRY_STATUSES and attempt < MAX_RETRIES:
+            time.sleep(_retry_after(r.headers, attempt))
+            continue
+        if not r.ok:
+            log.append(f"Batch request failed: {r.status_code} - {r.text}")
+            for row in pending.values():
+                log.append(f"  ✗ Failed: {row['subject'][:50]}")
+            return created_count, failed_count + len(pending), log
+
+        responses = r.json().get("responses", [])
+        retry_ids = {}
+        wait = 0.0
+        for resp in responses:
+            req_id = resp.get("id")
+            row = pending.get(req_id)
+            if row is None:
+                continue
+            status = resp.get("status", 0)
+            if 200 <= status < 300:
+                created_count += 1
+                log.append(f"  ✓ Created: {row['subject'][:50]}")
+            elif status in RETRY_STATUSES and attempt < MAX_RETRIES:
+                retry_ids[req_id] = row
+                wait = max(wait, _retry_after(resp.get("headers"), attempt))
+            else:
+                failed_count += 1
+                error = (resp.get("body") or {}).get("error", {})
+                log.append(f"  ✗ Failed: {row['subject'][:50]}")
+                log.append(f"    Error: {status} - {error.get('message', error)}")
+
+        # A sub-request Graph did not answer is a failure, not silently dropped
+        answered = {resp.get("id") for resp in responses}
+        for req_id, row in pending.items():
+            if req_id not in answered:
+                failed_count += 1
+                log.append(f"  ✗ Failed: {row['subject'][:50]}")
+                log.append("    Error: no response in $batch result")
+
+        if not retry_ids:
+            return created_count, failed_count, log
+        pending = retry_ids
+        time.sleep(wait)
+
+    return created_count, failed_count + len(pending), log
+
+
+def iter_csv_batches(csv_path):
+    """Yield lists of up to BATCH_SIZE email_data dicts read from the CSV"""
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header:
+            return  # empty file: nothing to create, as with DictReader
+        idx = {name: i for i, name in enumerate(header)}
+        date_i, email_i, name_i, subject_i, body_i = cols = (
+            idx['Date'], idx['From Email'], idx['From Name'],
+            idx['Subject'], idx['Email Body Preview'],
+        )
+        min_len = max(cols) + 1
+
+        batch_rows = []
+        for row in reader:
+            if not row:
+                continue  # DictReader skipped blank lines too
+            if len(row) < min_len:
+                print(f"Skipping CSV line {reader.line_num}: expected at least {min_len} columns, got {len(row)}")
+                continue
+            batch_rows.append({
+                'date': row[date_i] + 'T09:00:00Z',  # Add time component
+                'from_email': row[email_i],
+                'from_name': row[name_i],
+                'subject': row[subject_i],
+                'body': row[body_i]
+            })
+            if len(batch_rows) == BATCH_SIZE:
+                yield batch_rows
+                batch_rows = []
+
+        if batch_rows:
+            yield batch_rows
+
+
+def parse_csv_and_create_emails(csv_path, post_headers, folder_id):
+    """Read CSV and create all test emails, sending up to MAX_CONCURRENT_BATCHES batches at once"""
+    created_count = 0
+    failed_count = 0
+
+    def _send(batch_rows):
+        return send_batch(post_headers, folder_id, batch_rows)
+
+    # requests releases the GIL while waiting on the socket, so worker threads
+    # sharing the pooled SESSION overlap their round trips
+    # ex.map submits its whole input up front, so feed it one chunk at a time
+    batches = iter_csv_batches(csv_path)
+    batches_per_chunk = max(CSV_CHUNK_ROWS // BATCH_SIZE, 1)
+    batch_no = 0
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_BATCHES) as ex:
+        while True:
+            chunk = list(islice(batches, batches_per_chunk))
+            if not chunk:
+                break
+            # Results come back in submission order; print each batch's log as one block
+            for created, failed, log in ex.map(_send, chunk):
+                batch_no += 1
+                print(f"Batch {batch_no}: {created} created, {failed} failed")
+                for line in log:
+                    print(line)
+                created_count += created
+                failed_count += failed
+
+    return created_count, failed_count
+
 
 def main():
-print(“Starting test email creation…\n”)
-
-```
-# Check if CSV exists
-if not os.path.exists(CSV_FILE):
-    print(f"ERROR: CSV file '{CSV_FILE}' not found!")
-    print("Please save your CSV file and update the CSV_FILE path in the script.")
-    return
-
-# Authenticate
-token = acquire_token_with_diagnostics()
-headers = {"Authorization": f"Bearer {token}"}
-
-# Find the folder
-folder_id = find_mail_folder_id(headers, DEMO_FOLDER_NAME)
-if not folder_id:
-    print(f"\nERROR: Folder '{DEMO_FOLDER_NAME}' not found!")
-    print("Please create this folder in Outlook first.")
-    return
-
-print(f"\nFound folder: {DEMO_FOLDER_NAME}")
-print(f"Reading CSV: {CSV_FILE}\n")
-
-# Create all emails
-created, failed = parse_csv_and_create_emails(CSV_FILE, headers, folder_id)
-
-print(f"\n{'='*50}")
-print(f"COMPLETE!")
-print(f"  Created: {created} emails")
-print(f"  Failed:  {failed} emails")
-print(f"{'='*50}")
-```
-
-if **name** == “**main**”:
-main()
+    print("Starting test email creation…\n")
+
+    # Check if CSV exists
+    if not os.path.exists(CSV_FILE):
+        print(f"ERROR: CSV file '{CSV_FILE}' not found!")
+        print("Please save your CSV file and update the CSV_FILE path in the script.")
+        return
+
+    try:
+        # Authenticate
+        token, account_id = acquire_token()
+        headers = {"Authorization": f"Bearer {token}"}
+        # Built once and shared by every POST
+        post_headers = {**headers, "Content-Type": "application/json", "Accept": "application/json"}
+
+        # Find the folder
+        folder_id = find_mail_folder_id(headers, DEMO_FOLDER_NAME, account_id)
+        if not folder_id:
+            print(f"\nERROR: Folder '{DEMO_FOLDER_NAME}' not found!")
+            print("Please create this folder in Outlook first.")
+            return
+
+        print(f"\nFound folder: {DEMO_FOLDER_NAME}")
+        print(f"Reading CSV: {CSV_FILE}\n")
+
+        # Create all emails
+        created, failed = parse_csv_and_create_emails(CSV_FILE, post_headers, folder_id)
+
+        print(f"\n{'='*50}")
+        print(f"COMPLETE!")
+        print(f"  Created: {created} emails")
+        print(f"  Failed:  {failed} emails")
+        print(f"{'='*50}")
+    finally:
+        SESSION.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+graph_auth.py — Shared delegated (device-code) sign-in for the Graph demo scripts.
+- Tries a cached token silently first, then falls back to device code
+- Persists MSAL's token cache and HTTP (authority discovery) cache next to the scripts,
+  so graph_demo.py and create_test_emails.py share one sign-in
+"""
+
+import os, pickle, atexit
+from typing import Dict, Tuple
+
+import msal
+
+# ========= CONFIG =========
+CLIENT_ID = "0ade3d5c-b527-46ad-adac-af00003a111b"  # <-- your App Registration's Application (client) ID
+AUTHORITIES = [
+    "https://login.microsoftonline.com/consumers",  # personal MSA only
+    "https://login.microsoftonline.com/common",     # any org + personal
+]
+SCOPES = ["User.Read", "Mail.ReadWrite"]            # Delegated Graph scopes (do NOT include 'offline_access')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+HTTP_CACHE_PATH = os.path.join(BASE_DIR, "msal_http_cache.bin")
+TOKEN_CACHE_FILE = os.path.join(BASE_DIR, "msal_token_cache.bin")
+# ==========================
+
+
+# ---------- Cache persistence ----------
+def _load_msal_http_cache(path: str) -> Dict:
+    """
+    Load MSAL's HTTP cache (authority/OIDC discovery responses) from disk and
+    write it back at exit, so later runs skip the discovery round trips.
+    """
+    try:
+        with open(path, "rb") as f:
+            cache = pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError, ValueError):
+        cache = {}  # missing or corrupt cache: start fresh
+
+    def _save() -> None:
+        with open(path, "wb") as f:
+            pickle.dump(cache, f)
+
+    atexit.register(_save)
+    return cache
+
+def _load_token_cache(path: str) -> msal.SerializableTokenCache:
+    """Load the persisted MSAL token cache so silent auth works across runs."""
+    cache = msal.SerializableTokenCache()
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = f.read()
+        try:
+            cache.deserialize(data)
+        except ValueError:
+            cache = msal.SerializableTokenCache()  # corrupt cache: start fresh
+    return cache
+
+def _save_token_cache(cache: msal.SerializableTokenCache, path: str) -> None:
+    """Write the token cache back (owner-only permissions) if MSAL changed it."""
+    if not cache.has_state_changed:
+        return
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(cache.serialize())
+    os.chmod(path, 0o600)
+
+
+# ---------- Auth with diagnostics (device code) ----------
+def _device_flow_account_id(app: msal.PublicClientApplication, result: Dict) -> str:
+    """home_account_id of the account a device-flow result signed in (same key the silent path uses)."""
+    claims = result.get("id_token_claims") or {}
+    username = claims.get("preferred_username")
+    accounts = app.get_accounts(username=username) if username else []
+    if accounts:
+        return accounts[0]["home_account_id"]
+    return claims.get("oid") or claims.get("sub") or "unknown"
+
+def acquire_token(cache_path: str = TOKEN_CACHE_FILE,
+                  http_cache_path: str = HTTP_CACHE_PATH) -> Tuple[str, str]:
+    """
+    Try consumers -> common. If device flow init fails, print detailed hints.
+    Returns (access_token, account_id); account_id is MSAL's home_account_id,
+    used to keep per-user caches apart.
+    """
+    last_error_detail = None
+    http_cache = _load_msal_http_cache(http_cache_path)
+    token_cache = _load_token_cache(cache_path)
+    for authority in AUTHORITIES:
+        print(f"Trying authority: {authority}")
+        app = msal.PublicClientApplication(client_id=CLIENT_ID, authority=authority,
+                                           http_cache=http_cache, token_cache=token_cache)
+
+        # Silent (cached token) first
+        accounts = app.get_accounts()
+        if accounts:
+            try:
+                result = app.acquire_token_silent(SCOPES, account=accounts[0])
+                _save_token_cache(token_cache, cache_path)
+                if result and "access_token" in result:
+                    print("Got cached token.")
+                    return result["access_token"], accounts[0]["home_account_id"]
+            except Exception as e:
+                print(f"Silent token attempt failed: {e}")
+
+        # Device code flow
+        try:
+            flow = app.initiate_device_flow(scopes=SCOPES)
+        except Exception as e:
+            last_error_detail = f"initiate_device_flow exception: {e}"
+            print(f"Device flow init error: {e}")
+            continue
+
+        if "user_code" not in flow:
+            err = flow.get("error") or "unknown_error"
+            desc = flow.get("error_description") or "No description"
+            last_error_detail = f"{err}: {desc}"
+            print(f"Device flow init response error — {err}: {desc}")
+            continue
+
+        print(flow["message"])  # "Open https://www.microsoft.com/link and enter code ..."
+        result = app.acquire_token_by_device_flow(flow)
+        _save_token_cache(token_cache, cache_path)
+
+        if "access_token" in result:
+            print("Token acquired.")
+            return result["access_token"], _device_flow_account_id(app, result)
+
+        err = result.get("error")
+        desc = result.get("error_description")
+        last_error_detail = f"{err}: {desc}"
+        print(f"Device flow acquisition failed — {err}: {desc}")
+
+    raise RuntimeError(
+        "Failed to create/complete device flow. "
+        f"Details: {last_error_detail or 'no additional info'}\n\n"
+        "Fix checklist:\n"
+        "  1) Azure App Registration > Authentication: 'Allow public client flows' = Yes\n"
+        "  2) Supported account types include Personal Microsoft accounts (MSA)\n"
+        "  3) CLIENT_ID matches the configured app\n"
+        "  4) SCOPES are delegated Graph scopes only: ['User.Read', 'Mail.ReadWrite']"
+    )
+
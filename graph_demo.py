@@ -7,22 +7,23 @@ graph_demo.py — Personal Outlook.com demo using Microsoft Graph with delegated
 - Renders Tailwind dashboard from dashboard_template.html and auto-opens it
 """
 
-import os, sys, json, html, webbrowser
+import os, sys, re, json, html, webbrowser
 from datetime import datetime, timezone
-from typing import Dict, List
+from itertools import repeat
+from typing import Dict, Iterator, List, Optional, Tuple
 
-import requests
-import msal
+from graph_auth import acquire_token
+from graph_helpers import GRAPH, SESSION, find_mail_folder_id
+
+try:
+    from ciso8601 import parse_datetime  # optional C ISO-8601 parser
+except ImportError:
+    def parse_datetime(s: str) -> datetime:
+        # fromisoformat only accepts a trailing "Z" from Python 3.11 on
+        return datetime.fromisoformat(s.replace("Z", "+00:00"))
 
 # ========= CONFIG =========
-CLIENT_ID = "0ade3d5c-b527-46ad-adac-af00003a111b"  # <-- your App Registration's Application (client) ID
-AUTHORITIES = [
-    "https://login.microsoftonline.com/consumers",  # personal MSA only
-    "https://login.microsoftonline.com/common",     # any org + personal
-]
-SCOPES = ["User.Read", "Mail.ReadWrite"]            # Delegated Graph scopes (do NOT include 'offline_access')
-
-GRAPH = "https://graph.microsoft.com/v1.0"
+# Sign-in settings (CLIENT_ID, AUTHORITIES, SCOPES) live in graph_auth.py
 DEMO_FOLDER_NAME = "DEMO for PNC"
 TOP = 50
 
@@ -33,8 +34,11 @@ OUT_FILE = os.path.join(BASE_DIR, "dashboard.html")
 
 
 # ---------- HTTP / Graph helpers ----------
+# GRAPH and the pooled SESSION are shared from graph_helpers.py
 def _graph_get(path: str, headers: Dict, params: Dict = None) -> Dict:
-    r = requests.get(f"{GRAPH}{path}", headers=headers, params=params)
+    # `path` may also be an absolute URL, e.g. an @odata.nextLink
+    url = path if path.startswith("https://") else f"{GRAPH}{path}"
+    r = SESSION.get(url, headers=headers, params=params)
     if not r.ok:
         raise RuntimeError(f"GET {path} failed ({r.status_code}): {r.text}")
     return r.json()
@@ -42,23 +46,29 @@ def _graph_get(path: str, headers: Dict, params: Dict = None) -> Dict:
 def _get_me(headers: Dict) -> Dict:
     return _graph_get("/me", headers)
 
-def _find_mail_folder_id(headers: Dict, display_name: str) -> str:
-    safe = display_name.replace("'", "''")
-    data = _graph_get("/me/mailFolders", headers, params={"$filter": f"displayName eq '{safe}'", "$top": 10})
-    vals = data.get("value", [])
-    return vals[0]["id"] if vals else None
-
-def _list_messages(headers: Dict, folder_id: str, top: int) -> List[Dict]:
+def _list_messages(headers: Dict, folder_id: str, top: int) -> Iterator[Dict]:
+    """Yield up to `top` messages, following @odata.nextLink one page at a time."""
     params = {
         "$top": min(top, 100),
-        "$select": "id,subject,from,receivedDateTime,hasAttachments,conversationId",
-        "$orderby": "receivedDateTime desc",
+        "$select": "subject,receivedDateTime,hasAttachments",  # only what _classify and the dashboard read
+        # no $orderby: Graph lists folder messages newest-first already; main sorts the page client-side
     }
     data = _graph_get(f"/me/mailFolders/{folder_id}/messages", headers, params=params)
-    return data.get("value", [])
+    remaining = top
+    while True:
+        page = data.get("value", [])[:remaining]
+        yield from page
+        remaining -= len(page)
+        next_link = data.get("@odata.nextLink")
+        if remaining <= 0 or not next_link:
+            return
+        data = _graph_get(next_link, headers)  # nextLink already carries the query
 
 
 # ---------- Classification & formatting ----------
+FILED_RE = re.compile(r"quote|policy|binder|endorsement", re.I)
+TRIAGE_RE = re.compile(r"claim", re.I)
+
 def _classify(msg: Dict) -> str:
     """
     Demo rules:
@@ -66,155 +76,128 @@ def _classify(msg: Dict) -> str:
       - Triage: has attachments OR subject contains 'claim'
       - Skipped: everything else
     """
-    subject = (msg.get("subject") or "").lower()
-    has_attach = bool(msg.get("hasAttachments"))
-    if any(k in subject for k in ("quote", "policy", "binder", "endorsement")):
+    subject = msg.get("subject") or ""
+    if FILED_RE.search(subject):
         return "filed"
-    if has_attach or "claim" in subject:
+    if msg.get("hasAttachments") or TRIAGE_RE.search(subject):
         return "triage"
     return "skipped"
 
+DISPLAY_TS_FORMAT = "%Y-%m-%d %H:%M UTC"
+
 def _iso_to_display(s: str) -> str:
     if not s:
         return ""
     try:
-        dt = datetime.fromisoformat(s.replace("Z", "+00:00")).astimezone(timezone.utc)
-        return dt.strftime("%Y-%m-%d %H:%M UTC")
+        return parse_datetime(s).astimezone(timezone.utc).strftime(DISPLAY_TS_FORMAT)
     except Exception:
         return s
 
 
 # ---------- Tailwind dashboard renderer (uses your template) ----------
-def render_tailwind_dashboard(messages: List[Dict], folder_display: str = DEMO_FOLDER_NAME) -> None:
+# Rows expected by the template/JS counters (needs `.status-badge` with text: Filed/Triage/Skipped)
+STATUS_LABEL = {"filed": "Filed", "triage": "Triage", "skipped": "Skipped"}
+ROW_TPL = (
+    "<tr>"
+    "<td class='p-4'><span class='status-badge inline-block px-2 py-1 rounded-full text-xs bg-gray-100'>{status}</span></td>"
+    "<td class='p-4'>{subject}</td>"
+    "<td class='p-4'>{filed_dir}</td>"
+    "<td class='p-4'>{timestamp}</td>"
+    "</tr>"
+)
+
+TEMPLATE_TOKENS_RE = re.compile(rb"(\{RUN_TIME\}|<!-- REPORT_DATA -->)")
+_template_cache: Dict = {"mtime": None, "parts": ()}
+
+def _template_parts() -> Tuple[bytes, ...]:
+    """
+    Raw UTF-8 template split at its placeholders (odd indices are the tokens),
+    re-read only when the file's mtime changes.
+    """
+    mtime = os.stat(TEMPLATE_FILE).st_mtime
+    if _template_cache["mtime"] != mtime:
+        with open(TEMPLATE_FILE, "rb") as f:
+            _template_cache["parts"] = tuple(TEMPLATE_TOKENS_RE.split(f.read()))
+        _template_cache["mtime"] = mtime
+    return _template_cache["parts"]
+
+def render_tailwind_dashboard(statuses: List[str], subjects: List[str], timestamps: List[str],
+                              folder_display: str = DEMO_FOLDER_NAME,
+                              filed_dirs: Optional[List[str]] = None) -> None:
     """
-    messages: list of dicts:
-      - status in {"filed","triage","skipped"}
-      - subject (str), filed_dir (str), timestamp (str)
+    Parallel columns, one entry per message:
+      - statuses in {"filed","triage","skipped"}
+      - subjects (str), timestamps (str)
+      - filed_dirs (str), optional; defaults to folder_display for every row
     """
     if not os.path.isfile(TEMPLATE_FILE):
         raise FileNotFoundError(f"Template not found: {TEMPLATE_FILE}")
 
-    # Build rows expected by the template/JS counters (needs `.status-badge` with text: Filed/Triage/Skipped)
-    rows_html = []
-    for m in messages:
-        status_label = {"filed": "Filed", "triage": "Triage", "skipped": "Skipped"}[m["status"]]
-        rows_html.append(
-            "<tr>"
-            f"<td class='p-4'><span class='status-badge inline-block px-2 py-1 rounded-full text-xs bg-gray-100'>{html.escape(status_label)}</span></td>"
-            f"<td class='p-4'>{html.escape(m.get('subject',''))}</td>"
-            f"<td class='p-4'>{html.escape(m.get('filed_dir', folder_display))}</td>"
-            f"<td class='p-4'>{html.escape(m.get('timestamp',''))}</td>"
-            "</tr>"
+    esc = html.escape
+    escaped_folder = esc(folder_display)  # rows almost always use the default folder
+    dirs = (repeat(escaped_folder) if filed_dirs is None
+            else [escaped_folder if d == folder_display else esc(d) for d in filed_dirs])
+    rows_html = [
+        ROW_TPL.format(
+            status=STATUS_LABEL[status],  # fixed labels, nothing to escape
+            subject=esc(subject),
+            filed_dir=filed_dir,
+            timestamp=esc(timestamp),
         )
+        for status, subject, filed_dir, timestamp in zip(statuses, subjects, dirs, timestamps)
+    ]
     if not rows_html:
         rows_block = "<tr><td colspan='4' class='text-center text-gray-500 py-4'>No emails were processed.</td></tr>"
     else:
         rows_block = "\n".join(rows_html)
 
-    # Inject runtime + rows into template
-    with open(TEMPLATE_FILE, "r", encoding="utf-8") as f:
-        tpl = f.read()
-    tpl = tpl.replace("{RUN_TIME}", datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC"))
-    tpl = tpl.replace("<!-- REPORT_DATA -->", rows_block)
+    # Inject runtime + rows into template; encode once and write a single blob
+    values = {
+        b"{RUN_TIME}": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC").encode("utf-8"),
+        b"<!-- REPORT_DATA -->": rows_block.encode("utf-8"),
+    }
+    parts = _template_parts()
+    out = b"".join(values[p] if i % 2 else p for i, p in enumerate(parts))
 
-    with open(OUT_FILE, "w", encoding="utf-8") as f:
-        f.write(tpl)
+    with open(OUT_FILE, "wb") as f:
+        f.write(out)
 
     webbrowser.open(OUT_FILE)
 
 
-# ---------- Auth with diagnostics (device code) ----------
-def acquire_token_with_diagnostics() -> str:
-    """
-    Try consumers -> common. If device flow init fails, print detailed hints.
-    """
-    last_error_detail = None
-    for authority in AUTHORITIES:
-        print(f"Trying authority: {authority}")
-        app = msal.PublicClientApplication(client_id=CLIENT_ID, authority=authority)
-
-        # Silent (cached token) first
-        accounts = app.get_accounts()
-        if accounts:
-            try:
-                result = app.acquire_token_silent(SCOPES, account=accounts[0])
-                if result and "access_token" in result:
-                    print("Got cached token.")
-                    return result["access_token"]
-            except Exception as e:
-                print(f"Silent token attempt failed: {e}")
-
-        # Device code flow
-        try:
-            flow = app.initiate_device_flow(scopes=SCOPES)
-        except Exception as e:
-            last_error_detail = f"initiate_device_flow exception: {e}"
-            print(f"Device flow init error: {e}")
-            continue
-
-        if "user_code" not in flow:
-            err = flow.get("error") or "unknown_error"
-            desc = flow.get("error_description") or "No description"
-            last_error_detail = f"{err}: {desc}"
-            print(f"Device flow init response error — {err}: {desc}")
-            continue
-
-        print(flow["message"])  # "Open https://www.microsoft.com/link and enter code ..."
-        result = app.acquire_token_by_device_flow(flow)
-
-        if "access_token" in result:
-            print("Token acquired.")
-            return result["access_token"]
-
-        err = result.get("error")
-        desc = result.get("error_description")
-        last_error_detail = f"{err}: {desc}"
-        print(f"Device flow acquisition failed — {err}: {desc}")
-
-    raise RuntimeError(
-        "Failed to create/complete device flow. "
-        f"Details: {last_error_detail or 'no additional info'}\n\n"
-        "Fix checklist:\n"
-        "  1) Azure App Registration > Authentication: 'Allow public client flows' = Yes\n"
-        "  2) Supported account types include Personal Microsoft accounts (MSA)\n"
-        "  3) CLIENT_ID matches the configured app\n"
-        "  4) SCOPES are delegated Graph scopes only: ['User.Read', 'Mail.ReadWrite']"
-    )
-
-
 # ---------- Main ----------
 def main():
     print("Starting Microsoft Graph Email Filer Demo...")
 
-    token = acquire_token_with_diagnostics()
-    headers = {"Authorization": f"Bearer {token}"}
-
-    me = _get_me(headers)
-    upn = me.get("userPrincipalName") or me.get("mail")
-    print("Signed in as:", upn)
-
-    folder_id = _find_mail_folder_id(headers, DEMO_FOLDER_NAME)
-    if not folder_id:
-        print(f"ERROR: Folder '{DEMO_FOLDER_NAME}' not found in your mailbox.")
-        sys.exit(1)
-
-    msgs = _list_messages(headers, folder_id, TOP)
-    print(f"Fetched {len(msgs)} message(s).")
-
-    # Build rows for dashboard
-    messages = []
-    for m in msgs:
-        status = _classify(m)
-        messages.append({
-            "status": status,
-            "subject": m.get("subject") or "",
-            "filed_dir": DEMO_FOLDER_NAME,  # for demo we show the folder name; adjust if you sub-route
-            "timestamp": _iso_to_display(m.get("receivedDateTime")),
-        })
-
-    # Render Tailwind dashboard from your template
-    render_tailwind_dashboard(messages, folder_display=DEMO_FOLDER_NAME)
-    print("Dashboard saved to:", OUT_FILE)
+    try:
+        token, account_id = acquire_token()
+        headers = {"Authorization": f"Bearer {token}"}
+
+        me = _get_me(headers)
+        upn = me.get("userPrincipalName") or me.get("mail")
+        print("Signed in as:", upn)
+
+        folder_id = find_mail_folder_id(headers, DEMO_FOLDER_NAME, account_id)
+        if not folder_id:
+            print(f"ERROR: Folder '{DEMO_FOLDER_NAME}' not found in your mailbox.")
+            sys.exit(1)
+
+        # Newest first; sorting a few pages in Python is cheaper than a server-side $orderby
+        msgs = sorted(_list_messages(headers, folder_id, TOP),
+                      key=lambda m: m.get("receivedDateTime") or "", reverse=True)
+
+        # Build dashboard columns (for demo every row shows the folder name; pass filed_dirs if you sub-route)
+        subjects = [m.get("subject") or "" for m in msgs]
+        statuses = list(map(_classify, msgs))
+        timestamps = [_iso_to_display(m.get("receivedDateTime")) for m in msgs]
+
+        print(f"Fetched {len(msgs)} message(s).")
+
+        # Render Tailwind dashboard from your template
+        render_tailwind_dashboard(statuses, subjects, timestamps, folder_display=DEMO_FOLDER_NAME)
+        print("Dashboard saved to:", OUT_FILE)
+    finally:
+        SESSION.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+graph_helpers.py — Shared Microsoft Graph plumbing for the demo scripts.
+- One pooled, keep-alive requests session for every Graph call
+- Mail folder ID lookup by display name, cached per signed-in account
+"""
+
+import os, json
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# ========= CONFIG =========
+GRAPH = "https://graph.microsoft.com/v1.0"
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FOLDER_CACHE = os.path.join(BASE_DIR, ".folder_cache.json")  # account id -> {displayName: folder id}
+# ==========================
+
+
+# ---------- HTTP session ----------
+# Retries throttled/failed requests for idempotent methods only; urllib3 never
+# retries POST by default, so $batch callers handle their own throttling.
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=32,
+    max_retries=Retry(total=5, backoff_factor=0.5,
+                      status_forcelist=[429, 500, 502, 503, 504],
+                      raise_on_status=False),
+))
+
+
+# ---------- Mail folder lookup (cached) ----------
+def _load_folder_cache() -> Dict:
+    try:
+        with open(FOLDER_CACHE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # Drop anything that isn't a per-account mapping (e.g. an older flat cache)
+    return {k: v for k, v in data.items() if isinstance(v, dict)} if isinstance(data, dict) else {}
+
+def _save_folder_cache(cache: Dict) -> None:
+    with open(FOLDER_CACHE, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2)
+
+def _cached_folder_matches(headers: Dict, folder_id: str, display_name: str) -> bool:
+    """
+    True if the cached folder still exists under this name. Any failed check
+    (404, malformed or foreign-mailbox ID, 5xx) is just a cache miss.
+    """
+    r = SESSION.get(f"{GRAPH}/me/mailFolders/{folder_id}", headers=headers,
+                    params={"$select": "id,displayName"})
+    return r.ok and r.json().get("displayName") == display_name
+
+def find_mail_folder_id(headers: Dict, display_name: str, account_id: str) -> Optional[str]:
+    """
+    Folder ID for `display_name` in the signed-in mailbox. Folder IDs are stable,
+    so the ID cached for this account is reused while it still checks out;
+    otherwise the $filter search runs and rewrites the cache entry.
+    """
+    cache = _load_folder_cache()
+    account_cache = cache.setdefault(account_id, {})
+    cached_id = account_cache.get(display_name)
+    if cached_id and _cached_folder_matches(headers, cached_id, display_name):
+        return cached_id
+
+    safe = display_name.replace("'", "''")
+    r = SESSION.get(f"{GRAPH}/me/mailFolders", headers=headers,
+                    params={"$filter": f"displayName eq '{safe}'", "$top": 10})
+    if not r.ok:
+        raise RuntimeError(f"GET /me/mailFolders failed ({r.status_code}): {r.text}")
+    vals = r.json().get("value", [])
+    folder_id = vals[0]["id"] if vals else None
+    if folder_id:
+        account_cache[display_name] = folder_id
+    else:
+        account_cache.pop(display_name, None)
+    _save_folder_cache(cache)
+    return folder_id